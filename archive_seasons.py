@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# archive_seasons.py —— 按年份 (wine_batch.harvest_year) 把已结束的季节移出 wine_demo.db
+# 用法示例：
+#   python archive_seasons.py --before 2012           # harvest_year < 2012 的季节 → archive/wine_<年代>s.db
+#   python archive_seasons.py --before 2012 --npz     # 另外导出压缩列式冷备 archive/wine_<年代>s.npz
+#   python archive_seasons.py --list                  # 查看热库 / 各归档文件的行数与大小
+#
+# 每个归档文件存一个年代（如 wine_2010s.db 含 2010–2019 各季节），
+# 这样即使上线几十年，ATTACH 的文件数也远低于 SQLite 的上限（默认 10）。
+#
+# 读端用 open_db() 代替 sqlite3.connect()：它把 archive/ 下各归档库 ATTACH 上来，
+# 并用同名 TEMP VIEW（UNION ALL）遮住 main 里的表，原有 SELECT 语句不用改就能查到已归档的瓶子。
+import sqlite3, argparse, pathlib, re, sys
+
+ARCHIVE_DIR = "archive"
+# 归档顺序：先父后子；删除时倒序
+ARCHIVE_TABLES = {
+    "wine_batch":      "harvest_year = :year",
+    "bottle":          "batch_id IN (SELECT id FROM main.wine_batch WHERE harvest_year = :year)",
+    "transport_event": "bottle_id IN (SELECT b.id FROM main.bottle b JOIN main.wine_batch w"
+                       " ON w.id = b.batch_id WHERE w.harvest_year = :year)",
+    "sold_event":      "bottle_id IN (SELECT b.id FROM main.bottle b JOIN main.wine_batch w"
+                       " ON w.id = b.batch_id WHERE w.harvest_year = :year)",
+    "chain_tx":        "bottle_id IN (SELECT b.id FROM main.bottle b JOIN main.wine_batch w"
+                       " ON w.id = b.batch_id WHERE w.harvest_year = :year)",
+    # coldchain_analytics.py 的汇总：季节关闭后不再变，随季节归档，之后只重算热库部分
+    "shipment_summary": "bottle_id IN (SELECT b.id FROM main.bottle b JOIN main.wine_batch w"
+                        " ON w.id = b.batch_id WHERE w.harvest_year = :year)",
+    "batch_summary":    "batch_id IN (SELECT id FROM main.wine_batch WHERE harvest_year = :year)",
+}
+
+
+def _cols(conn, schema: str, table: str) -> list:
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table});")]
+
+
+def archive_path(year: int, archive_dir: str = ARCHIVE_DIR) -> pathlib.Path:
+    """某季节所在的年代归档文件"""
+    return pathlib.Path(archive_dir) / f"wine_{year // 10 * 10}s.db"
+
+
+def archive_files(archive_dir: str = ARCHIVE_DIR) -> dict:
+    """{标签: path}，按年份升序；标签如 '2010s'（旧版按年归档的 '2010' 也认）"""
+    files = {}
+    for p in pathlib.Path(archive_dir).glob("wine_*.db"):
+        m = re.fullmatch(r"wine_(\d{4}s?)\.db", p.name)
+        if m:
+            files[m.group(1)] = p
+    return dict(sorted(files.items()))
+
+
+# ─── 1. 读端：透明查询层 ──────────────────────────────────────
+def open_db(db_path: str = "wine_demo.db", archive_dir: str = ARCHIVE_DIR) -> sqlite3.Connection:
+    """打开热库并挂上全部归档；只用于读（TEMP VIEW 不可写）"""
+    conn = sqlite3.connect(db_path, uri=True)
+    files = archive_files(archive_dir)
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(conn, "getlimit") else 10
+    if len(files) > limit:
+        # 按年代归档时要上百年才会到这里；只挂最近的几个，热库照常可用
+        print(f"⚠  归档文件 {len(files)} 个超过 ATTACH 上限 {limit}，只挂最近 {limit} 个", file=sys.stderr)
+        files = dict(list(files.items())[-limit:])
+
+    for label, path in files.items():
+        conn.execute(f"ATTACH DATABASE ? AS season_{label};", (f"file:{path}?mode=ro",))
+
+    for table in ARCHIVE_TABLES:
+        cols = _cols(conn, "main", table)
+        if not cols or not files:
+            continue
+        parts = [f"SELECT {','.join(cols)} FROM main.{table}"]
+        for label in files:
+            have = set(_cols(conn, f"season_{label}", table))
+            if not have:
+                continue
+            sel = ",".join(c if c in have else f"NULL AS {c}" for c in cols)
+            parts.append(f"SELECT {sel} FROM season_{label}.{table}")
+        conn.execute(f"CREATE TEMP VIEW {table} AS {' UNION ALL '.join(parts)};")
+    return conn
+
+
+# ─── 2. 写端：归档一个季节 ────────────────────────────────────
+def _init_archive(conn, path: pathlib.Path):
+    """用热库里的建表 / 建索引语句初始化归档库，并保证按 bottle_id 查有索引
+
+    已存在的表不重建，但热库后来新增的列会 ALTER TABLE ADD COLUMN 补上，
+    否则按年代归档时后搬进来的季节会丢掉这些列。
+    """
+    arc = sqlite3.connect(path)
+    have = {r[0] for r in arc.execute("SELECT name FROM sqlite_master;")}
+    marks = ",".join("?" * len(ARCHIVE_TABLES))
+    for kind in ("table", "index"):              # 先表后索引
+        for name, sql in conn.execute(
+                "SELECT name, sql FROM main.sqlite_master WHERE type=? AND sql IS NOT NULL "
+                f"AND tbl_name IN ({marks});", (kind, *ARCHIVE_TABLES)):
+            if name not in have:
+                arc.execute(sql)
+            elif kind == "table":
+                arc_cols = set(_cols(arc, "main", name))
+                for _, col, decl, _notnull, dflt, _pk in conn.execute(f"PRAGMA main.table_info({name});"):
+                    if col not in arc_cols:       # NOT NULL 不带过来：归档里已有的旧行没有这一列的值
+                        arc.execute(f"ALTER TABLE {name} ADD COLUMN {col} {decl}"
+                                    + (f" DEFAULT {dflt}" if dflt is not None else "") + ";")
+    # 读端按瓶子查（WHERE bottle_id=?）会下推到每个归档表，没有索引就是全表扫描
+    for table in ARCHIVE_TABLES:
+        if "bottle_id" in _cols(arc, "main", table):
+            arc.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_bottle_id ON {table}(bottle_id);")
+    arc.commit()
+    arc.close()
+
+
+def unsummarized(conn, year: int) -> int:
+    """该季节有运输事件、但 shipment_summary 里没有汇总行的瓶子数"""
+    has_summary = bool(_cols(conn, "main", "shipment_summary"))
+    return conn.execute(f"""
+        SELECT COUNT(DISTINCT e.bottle_id) FROM main.transport_event e
+        JOIN main.bottle b ON b.id = e.bottle_id JOIN main.wine_batch w ON w.id = b.batch_id
+        WHERE w.harvest_year = ?
+        {"AND e.bottle_id NOT IN (SELECT bottle_id FROM main.shipment_summary)" if has_summary else ""};
+    """, (year,)).fetchone()[0]
+
+
+def archive_season(conn, year: int, archive_dir: str = ARCHIVE_DIR) -> dict:
+    """把一个季节的 batch / bottle / 运输 / 售出行搬进所属年代的归档库，同一事务内从热库删除"""
+    path = archive_path(year, archive_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _init_archive(conn, path)
+
+    conn.execute("ATTACH DATABASE ? AS arc;", (str(path),))
+    moved = {}
+    try:
+        conn.execute("BEGIN;")
+        tables = {t: w for t, w in ARCHIVE_TABLES.items() if _cols(conn, "main", t)}
+        for table, where in tables.items():
+            cols = _cols(conn, "main", table)
+            lost = set(cols) - set(_cols(conn, "arc", table))
+            if lost:                             # _init_archive 已补列；仍缺说明归档库异常，宁可不搬
+                raise RuntimeError(f"{path} 的 {table} 缺少列 {sorted(lost)}，放弃归档 {year} 季节")
+            cols = ",".join(cols)
+            cur = conn.execute(f"INSERT OR REPLACE INTO arc.{table}({cols}) "
+                               f"SELECT {cols} FROM main.{table} WHERE {where};", {"year": year})
+            moved[table] = cur.rowcount
+        for table, where in reversed(tables.items()):
+            conn.execute(f"DELETE FROM main.{table} WHERE {where};", {"year": year})
+        conn.execute("COMMIT;")
+    except Exception:
+        conn.execute("ROLLBACK;")
+        raise
+    finally:
+        conn.execute("DETACH DATABASE arc;")
+    return moved
+
+
+def export_npz(path: pathlib.Path) -> pathlib.Path:
+    """归档库 → 压缩列式 .npz（每列一个数组，键为 "表.列"），供冷存储 / 离线审计"""
+    import numpy as np                           # 仅导出时需要；读端 open_db 不依赖 numpy
+    conn = sqlite3.connect(path)
+    arrays = {}
+    for table in ARCHIVE_TABLES:
+        info = conn.execute(f"PRAGMA table_info({table});").fetchall()
+        if not info:
+            continue
+        rows = conn.execute(f"SELECT * FROM {table};").fetchall()
+        for i, (_, col, decl, *_rest) in enumerate(info):
+            vals = [r[i] for r in rows]
+            if decl.upper() in ("INTEGER", "REAL"):
+                arrays[f"{table}.{col}"] = np.array(vals, dtype=np.float64)
+            else:
+                arrays[f"{table}.{col}"] = np.array(["" if v is None else str(v) for v in vals], dtype=str)
+    conn.close()
+    out = path.with_suffix(".npz")
+    np.savez_compressed(out, **arrays)
+    return out
+
+
+def main():
+    cli = argparse.ArgumentParser(description="按 harvest_year 归档已结束季节")
+    cli.add_argument("--db",          default="wine_demo.db")
+    cli.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    cli.add_argument("--before",      type=int, help="归档 harvest_year < 此年份的全部季节")
+    cli.add_argument("--npz",         action="store_true", help="同时导出压缩列式 .npz 冷备")
+    cli.add_argument("--force",       action="store_true", help="季节缺冷链汇总时也照样归档")
+    cli.add_argument("--list",        action="store_true", help="只列出热库与归档情况")
+    args = cli.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        if args.before is not None and not args.list:
+            years = [r[0] for r in conn.execute(
+                "SELECT DISTINCT harvest_year FROM wine_batch WHERE harvest_year < ? ORDER BY 1;",
+                (args.before,))]
+            for year in list(years):
+                missing = unsummarized(conn, year)
+                if missing and not args.force:
+                    print(f"⏭  {year} 季节有 {missing} 瓶没有冷链汇总，先运行 coldchain_analytics.py"
+                          "（或加 --force）")
+                    years.remove(year)
+                    continue
+                moved = archive_season(conn, year, args.archive_dir)
+                print(f"📦 {year} 季节已归档 → {archive_path(year, args.archive_dir)}：", moved)
+            if args.npz:
+                for path in sorted({archive_path(y, args.archive_dir) for y in years}):
+                    print("🧊 冷备导出 →", export_npz(path))
+            for path in archive_files(args.archive_dir).values():
+                _init_archive(conn, path)        # 旧归档文件补齐索引
+            if years:
+                conn.execute("VACUUM;")
+            else:
+                print("📄 没有需要归档的季节")
+
+        hot = {t: conn.execute(f"SELECT COUNT(*) FROM {t};").fetchone()[0]
+               for t in ARCHIVE_TABLES if _cols(conn, "main", t)}
+        print(f"\n🔥 热库 {args.db}（{pathlib.Path(args.db).stat().st_size // 1024} KiB）：", hot)
+        for label, path in archive_files(args.archive_dir).items():
+            print(f"🗄  {label}: {path}（{path.stat().st_size // 1024} KiB）")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
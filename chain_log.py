@@ -0,0 +1,47 @@
+# chain_log.py —— 写链脚本共用：把交易哈希、回执与事件日志落到 chain_tx 表
+# winery_produce / shipper_ship / retailer_deliver 在同一个 DB 事务里调用 record_tx，
+# proof_bundle.py 再据此生成离线证明包。
+import json
+from web3.logs import DISCARD
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chain_tx (
+  id           INTEGER PRIMARY KEY AUTOINCREMENT,
+  bottle_id    VARCHAR(64) NOT NULL,
+  stage        VARCHAR(16) NOT NULL,      -- produce / ship / deliver
+  kind         VARCHAR(16) NOT NULL,      -- lifecycle / storeHash
+  row_key      VARCHAR(66),
+  tx_hash      VARCHAR(66) NOT NULL,
+  block_number INTEGER,
+  block_hash   VARCHAR(66),
+  status       INTEGER,
+  logs_json    TEXT                       -- 解码后的 StageUpdated / HashStored 参数
+);
+CREATE INDEX IF NOT EXISTS idx_chain_tx_bottle ON chain_tx(bottle_id);
+"""
+
+# 每种交易要解码的事件
+EVENTS = {"lifecycle": "StageUpdated", "storeHash": "HashStored"}
+
+
+def _hex(v):
+    if isinstance(v, (bytes, bytearray)):
+        return "0x" + bytes(v).hex()
+    return v
+
+
+def decode_logs(contract, kind: str, rec) -> list:
+    """回执 → [{"event": 名称, "args": {...}}]，bytes 转成 0x 开头的 hex"""
+    event = getattr(contract.events, EVENTS[kind])()
+    return [{"event": ev["event"], "args": {k: _hex(v) for k, v in ev["args"].items()}}
+            for ev in event.process_receipt(rec, errors=DISCARD)]
+
+
+def record_tx(cur, bottle_id: str, stage: str, kind: str, rec, contract, row_key: bytes = None):
+    """一笔已确认交易写入 chain_tx（调用方负责事务）"""
+    cur.execute("""
+        INSERT INTO chain_tx(bottle_id,stage,kind,row_key,tx_hash,block_number,block_hash,status,logs_json)
+        VALUES(?,?,?,?,?,?,?,?,?);
+    """, (bottle_id, stage, kind, _hex(row_key),
+          _hex(rec.transactionHash), rec.blockNumber, _hex(rec.blockHash), rec.status,
+          json.dumps(decode_logs(contract, kind, rec), separators=(",", ":"))))
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# coldchain_analytics.py —— 冷链分析：transport_event 分块载入 NumPy，按瓶 / 按批次聚合后写回汇总表
+# 用法示例：
+#   python coldchain_analytics.py --temp-min 5 --temp-max 22 --sla-hours 72
+# 依赖：pip install numpy
+#
+# 输出两张表（每次运行重算热库部分）：
+#   shipment_summary —— 每瓶一行：事件数、运输时长、港口停留、温度超限窗口、迟到里程碑
+#   batch_summary    —— 每批次一行：运输时长分位数、超限瓶数、最长港口停留等
+# 已归档季节的汇总行随季节搬进 archive/（见 archive_seasons.py），重算时不会被清掉；
+# 跨季节查询用 archive_seasons.open_db()。
+import sqlite3, argparse, datetime
+import numpy as np
+
+SUMMARY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shipment_summary (
+  bottle_id         VARCHAR(64) PRIMARY KEY,
+  batch_id          INTEGER,
+  n_events          INTEGER,
+  n_milestones      INTEGER,
+  first_ts          INTEGER,
+  last_ts           INTEGER,
+  transit_s         INTEGER,
+  port_dwell_s      INTEGER,
+  max_port_dwell_s  INTEGER,
+  excursion_windows INTEGER,
+  excursion_s       INTEGER,
+  min_temp          REAL,
+  max_temp          REAL,
+  late_milestones   INTEGER
+);
+CREATE TABLE IF NOT EXISTS batch_summary (
+  batch_id          INTEGER PRIMARY KEY,
+  n_bottles         INTEGER,
+  transit_mean_s    REAL,
+  transit_p50_s     REAL,
+  transit_p90_s     REAL,
+  transit_p95_s     REAL,
+  max_port_dwell_s  INTEGER,
+  excursion_bottles INTEGER,
+  excursion_windows INTEGER,
+  late_milestones   INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_transport_event_bottle ON transport_event(bottle_id, id);
+"""
+
+TS_FORMATS = ("%d/%m/%Y", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d")
+
+
+# ─── 1. ts 解析 ───────────────────────────────────────────────
+def _ts_to_epoch(s: str) -> float:
+    """单个 ts 字符串 → unix 秒；库里混有 '1720554000' 与 '4/7/2025' 两种写法"""
+    s = s.strip()
+    if s.isdigit():
+        return float(s)
+    for fmt in TS_FORMATS:
+        try:
+            dt = datetime.datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+        return dt.replace(tzinfo=datetime.timezone.utc).timestamp()
+    return np.nan
+
+
+def _digits_to_int(values: np.ndarray) -> np.ndarray:
+    """纯数字字符串列 → int64：把定长 unicode 视作码点矩阵，按字符位做 Horner（宽度只有十来位）
+    比 values.astype(np.int64) 逐个解析快数倍"""
+    codes = np.ascontiguousarray(values).view(np.uint32).reshape(len(values), -1)
+    out = np.zeros(len(values), dtype=np.int64)
+    for col in codes.T:                               # 短字符串右侧补 0 码点，跳过
+        out = np.where(col != 0, out * 10 + (col.astype(np.int64) - 48), out)
+    return out
+
+
+def parse_ts(values: np.ndarray) -> np.ndarray:
+    """ts 列 → unix 秒：纯数字（epoch，几乎每行都不同）整列向量化转换；
+    其余日期字符串去重后只对唯一值 strptime，再按 inverse 下标展开"""
+    values = np.char.strip(values)
+    out = np.full(len(values), np.nan)
+    digits = np.char.isdigit(values) & (np.char.str_len(values) <= 18)   # 超过 18 位 int64 会溢出
+    if digits.any():
+        out[digits] = _digits_to_int(values[digits])
+    rest = ~digits
+    if rest.any():
+        uniq, inv = np.unique(values[rest], return_inverse=True)
+        parsed = np.fromiter((_ts_to_epoch(s) for s in uniq), dtype=np.float64, count=len(uniq))
+        out[rest] = parsed[inv]
+    return out
+
+
+# ─── 2. 分块读取 ──────────────────────────────────────────────
+def iter_event_chunks(conn, chunk_size: int):
+    """按 bottle_id 有序流式读取 transport_event，每块只含完整的瓶子分组
+
+    块尾那只瓶子的事件可能被截断，先留作 carry 并拼到下一块。
+    """
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(transport_event);")}
+    temp_expr = "e.temperature" if "temperature" in cols else "NULL"
+    cur = conn.execute(f"""
+        SELECT e.bottle_id, b.batch_id, e.ts, e.location, e.is_milestone, {temp_expr}
+        FROM transport_event e LEFT JOIN bottle b ON b.id = e.bottle_id
+        ORDER BY e.bottle_id, e.id;
+    """)
+
+    carry = None
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        bottle_id, batch_id, ts, location, is_milestone, temperature = zip(*rows)
+        chunk = {
+            "bottle":    np.array(bottle_id, dtype=str),
+            "batch":     np.array(batch_id, dtype=np.float64),
+            "ts":        np.array(ts, dtype=str),
+            "location":  np.array(location, dtype=str),
+            "milestone": np.nan_to_num(np.array(is_milestone, dtype=np.float64)) == 1,
+            "temp":      np.array(temperature, dtype=np.float64),
+        }
+        if carry is not None:
+            chunk = {k: np.concatenate((carry[k], v)) for k, v in chunk.items()}
+
+        keep = chunk["bottle"] != chunk["bottle"][-1]
+        carry = {k: v[~keep] for k, v in chunk.items()}
+        if keep.any():
+            yield {k: v[keep] for k, v in chunk.items()}
+
+    if carry is not None and len(carry["bottle"]):
+        yield carry
+
+
+# ─── 3. 每瓶聚合（向量化 group-by）────────────────────────────
+SHIPMENT_COLS = ("bottle_id", "batch_id", "n_events", "n_milestones", "first_ts", "last_ts", "transit_s",
+                 "port_dwell_s", "max_port_dwell_s", "excursion_windows", "excursion_s",
+                 "min_temp", "max_temp", "late_milestones")
+
+
+def summarize_shipments(chunk: dict, opts) -> tuple:
+    """一块事件 → (每瓶一行的列数组, ts 无法解析而丢弃的行数)；全部用排序 + reduceat / bincount 完成"""
+    ts = parse_ts(chunk["ts"])
+    valid = ~np.isnan(ts)
+    dropped = int(len(ts) - valid.sum())
+    if not valid.any():                               # 整块 ts 都解析不了（常见于只剩一只瓶子的最后一块）
+        return {c: np.empty(0, dtype=str if c == "bottle_id" else np.float64) for c in SHIPMENT_COLS}, dropped
+    chunk = {k: v[valid] for k, v in chunk.items()}
+    ts = ts[valid]
+
+    bottles, b = np.unique(chunk["bottle"], return_inverse=True)
+    order = np.lexsort((ts, b))                       # 先按瓶，再按时间
+    b, ts = b[order], ts[order]
+    batch     = chunk["batch"][order]
+    milestone = chunk["milestone"][order]
+    temp      = chunk["temp"][order]
+    locs, loc = np.unique(chunk["location"], return_inverse=True)
+    loc = loc[order]
+
+    n, nb = len(b), len(bottles)
+    same_next = np.r_[b[1:] == b[:-1], False]         # 下一行是否同一瓶
+    starts = np.flatnonzero(np.r_[True, ~same_next[:-1]])
+    ends   = np.r_[starts[1:], n] - 1
+
+    first_ts, last_ts = ts[starts], ts[ends]
+
+    # a) 停留：同瓶连续同地点的事件合成一段，段长 = 下一段首事件时间 − 本段首事件时间
+    seg_start = np.flatnonzero(np.r_[True, ~same_next[:-1] | (loc[1:] != loc[:-1])])
+    seg_next  = np.r_[seg_start[1:], n]
+    seg_last  = seg_next - 1
+    seg_end_ts = np.where(same_next[seg_last], ts[np.minimum(seg_next, n - 1)], ts[seg_last])
+    is_port = np.char.find(np.char.lower(locs), opts.port_pattern.lower()) >= 0
+    port_dwell = np.where(is_port[loc[seg_start]], seg_end_ts - ts[seg_start], 0.0)
+    seg_bottle = b[seg_start]
+    seg_groups = np.flatnonzero(np.r_[True, seg_bottle[1:] != seg_bottle[:-1]])
+
+    # b) 温度超限窗口：同瓶连续超限读数为一个窗口，窗口结束于下一条正常读数（或最后一条超限读数）
+    out = (temp < opts.temp_min) | (temp > opts.temp_max)
+    prev_out = np.r_[False, out[:-1] & same_next[:-1]]
+    next_out = np.r_[out[1:], False] & same_next
+    run_start = np.flatnonzero(out & ~prev_out)
+    run_last  = np.flatnonzero(out & ~next_out)
+    run_end_ts = np.where(same_next[run_last], ts[np.minimum(run_last + 1, n - 1)], ts[run_last])
+    run_bottle = b[run_start]
+
+    # c) 迟到里程碑：距该瓶首个事件超过 SLA 的里程碑
+    late = milestone & (ts - first_ts[b] > opts.sla_hours * 3600)
+
+    return {
+        "bottle_id":         bottles,
+        "batch_id":          batch[starts],
+        "n_events":          np.diff(np.r_[starts, n]),
+        "n_milestones":      np.add.reduceat(milestone.astype(np.int64), starts),
+        "first_ts":          first_ts,
+        "last_ts":           last_ts,
+        "transit_s":         last_ts - first_ts,
+        "port_dwell_s":      np.bincount(seg_bottle, weights=port_dwell, minlength=nb),
+        "max_port_dwell_s":  np.maximum.reduceat(port_dwell, seg_groups),
+        "excursion_windows": np.bincount(run_bottle, minlength=nb),
+        "excursion_s":       np.bincount(run_bottle, weights=run_end_ts - ts[run_start], minlength=nb),
+        "min_temp":          np.fmin.reduceat(temp, starts),
+        "max_temp":          np.fmax.reduceat(temp, starts),
+        "late_milestones":   np.bincount(b, weights=late, minlength=nb),
+    }, dropped
+
+
+# ─── 4. 每批次聚合 ────────────────────────────────────────────
+def group_percentile(values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """values 已按组排好且组内升序；对每组做线性插值分位数（与 np.percentile 默认一致）"""
+    pos = starts + q / 100 * (counts - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.ceil(pos).astype(np.int64)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def summarize_batches(conn, chunk_size: int):
+    """从 shipment_summary 按 batch_id 流式读取，逐块产出每批次一行"""
+    cur = conn.execute("""
+        SELECT batch_id, transit_s, max_port_dwell_s, excursion_windows, late_milestones
+        FROM shipment_summary WHERE batch_id IS NOT NULL ORDER BY batch_id;
+    """)
+    carry = None
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if rows:
+            arr = np.array(rows, dtype=np.float64)
+            if carry is not None:
+                arr = np.concatenate((carry, arr))
+            keep = arr[:, 0] != arr[-1, 0]
+            carry, arr = arr[~keep], arr[keep]
+        else:
+            arr, carry = carry, None
+        if arr is not None and len(arr):
+            arr = arr[np.lexsort((arr[:, 1], arr[:, 0]))]
+            batch, transit, dwell, windows, late = arr.T
+            starts = np.flatnonzero(np.r_[True, batch[1:] != batch[:-1]])
+            counts = np.diff(np.r_[starts, len(batch)])
+            yield {
+                "batch_id":          batch[starts],
+                "n_bottles":         counts,
+                "transit_mean_s":    np.add.reduceat(transit, starts) / counts,
+                "transit_p50_s":     group_percentile(transit, starts, counts, 50),
+                "transit_p90_s":     group_percentile(transit, starts, counts, 90),
+                "transit_p95_s":     group_percentile(transit, starts, counts, 95),
+                "max_port_dwell_s":  np.maximum.reduceat(dwell, starts),
+                "excursion_bottles": np.add.reduceat((windows > 0).astype(np.int64), starts),
+                "excursion_windows": np.add.reduceat(windows, starts),
+                "late_milestones":   np.add.reduceat(late, starts),
+            }
+        if not rows:
+            break
+
+
+# ─── 5. 写回 ──────────────────────────────────────────────────
+INT_COLS = {"batch_id", "n_events", "n_milestones", "first_ts", "last_ts", "transit_s",
+            "port_dwell_s", "max_port_dwell_s", "excursion_windows", "excursion_s",
+            "late_milestones", "n_bottles", "excursion_bottles"}
+
+
+def write_summary(conn, table: str, cols: dict) -> int:
+    """列数组 → executemany；NaN 写成 NULL"""
+    out = []
+    for name, v in cols.items():
+        if v.dtype.kind not in "biuf":
+            out.append(v.tolist())
+            continue
+        v = v.astype(np.float64)
+        col = (np.rint(np.nan_to_num(v)).astype(np.int64) if name in INT_COLS else v).tolist()
+        for i in np.flatnonzero(np.isnan(v)):
+            col[i] = None
+        out.append(col)
+    names = ",".join(cols)
+    marks = ",".join("?" * len(cols))
+    conn.executemany(f"INSERT OR REPLACE INTO {table}({names}) VALUES({marks});", zip(*out))
+    return len(out[0])
+
+
+def main():
+    cli = argparse.ArgumentParser(description="transport_event 冷链分析 → shipment_summary / batch_summary")
+    cli.add_argument("--db",           default="wine_demo.db")
+    cli.add_argument("--chunk-size",   type=int,   default=500_000, help="每块读取的事件行数")
+    cli.add_argument("--temp-min",     type=float, default=5.0,  help="温度下限 (°C)")
+    cli.add_argument("--temp-max",     type=float, default=22.0, help="温度上限 (°C)")
+    cli.add_argument("--port-pattern", default="port", help="location 含此子串视为港口（不区分大小写）")
+    cli.add_argument("--sla-hours",    type=float, default=72.0, help="里程碑距首个事件超过此时长视为迟到")
+    opts = cli.parse_args()
+
+    conn = sqlite3.connect(opts.db)
+    conn.executescript(SUMMARY_SCHEMA)
+    try:
+        with conn:
+            conn.execute("DELETE FROM shipment_summary;")
+            conn.execute("DELETE FROM batch_summary;")
+
+            n_ship = n_dropped = 0
+            for chunk in iter_event_chunks(conn, opts.chunk_size):
+                cols, dropped = summarize_shipments(chunk, opts)
+                n_ship += write_summary(conn, "shipment_summary", cols)
+                n_dropped += dropped
+            print(f"📦 shipment_summary：{n_ship} 瓶")
+            if n_dropped:
+                print(f"⚠  {n_dropped} 行 ts 无法解析，已跳过")
+
+            n_batch = 0
+            for cols in summarize_batches(conn, opts.chunk_size):
+                n_batch += write_summary(conn, "batch_summary", cols)
+            print(f"📦 batch_summary   ：{n_batch} 批次")
+        print("✅ 冷链分析完成")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,14 @@ from eth_utils import keccak
 from web3 import Web3
 from dotenv import load_dotenv
 from tabulate import tabulate
+from archive_seasons import open_db
+from replicate_db import open_replica, replica_lag
 
 # ───────── 1. CLI ─────────────────────────────────────────────
 cli = argparse.ArgumentParser(description="Verify bottle provenance on-chain")
 cli.add_argument("--bottle-id", required=True, help="Bottle ID")
+cli.add_argument("--replica-dir", help="Read from this read-only replica instead of wine_demo.db")
+cli.add_argument("--max-lag", type=float, default=300, help="Max replica staleness in seconds")
 args = cli.parse_args()
 bid = args.bottle_id
 
@@ -20,8 +24,17 @@ w3  = Web3(Web3.HTTPProvider(cfg["rpc_url"]))
 life  = w3.eth.contract(address=cfg["life_addr"],  abi=json.load(open(cfg["life_abi"])))
 audit = w3.eth.contract(address=cfg["audit_addr"], abi=json.load(open(cfg["audit_abi"])))
 
-# ───────── 3. Read local DB rows ─────────────────────────────
-conn = sqlite3.connect("wine_demo.db")
+# ───────── 3. Read local DB rows (hot DB + archived seasons) ─
+if args.replica_dir:
+    try:
+        lag = replica_lag(args.replica_dir)
+    except (OSError, ValueError, KeyError):
+        raise SystemExit(f"Replica {args.replica_dir} is not initialised (no readable replica_meta.json).")
+    if lag > args.max_lag:
+        raise SystemExit(f"Replica {args.replica_dir} is {lag:.0f}s stale (> {args.max_lag:.0f}s).")
+    conn = open_replica(args.replica_dir)
+else:
+    conn = open_db("wine_demo.db")
 conn.row_factory = sqlite3.Row
 cur = conn.cursor()
 
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# diagnose_mismatch.py —— 批量排查 produce / ship / deliver 哈希不一致的原因
+# checkwhydifferent*.py 一次只能对一行手工比对；这里对一整批 row_key：
+#   1) 扫描 DB 反查每个 row_key 对应的行（rowKey 规则与三个写链脚本一致）
+#   2) 并行 getProof 取链上 hash
+#   3) 对每行并行尝试一组候选序列化（键序 / ts 类型 / 多余列 / 分隔符 …），
+#      第一个与链上一致的候选即为根因，最后按根因分组汇总
+# 用法示例：
+#   python diagnose_mismatch.py                               # 全库所有行
+#   python diagnose_mismatch.py --row-keys bad_keys.txt       # 只看指定 row_key（每行一个 0x…）
+#   python diagnose_mismatch.py --proofs-json proofs.json     # 离线：{row_key: chain_hash}
+# 依赖：pip install web3 python-dotenv tabulate
+import json, sqlite3, argparse, hashlib, itertools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from eth_utils import keccak
+from web3 import Web3
+from dotenv import load_dotenv
+from tabulate import tabulate
+from archive_seasons import open_db
+
+# ─── 1. 各段上链时的序列化规则 ────────────────────────────────
+# 字段顺序 = 写链脚本 json.dumps 时的键序（customer_verify.py 也按此复算）
+STAGE_FIELDS = {
+    "produce": ["id", "batch_id", "current_status", "retailer", "bottle_key"],
+    "ship":    ["location", "status", "ts", "is_milestone", "bottle_id"],
+    "deliver": ["bottle_id", "store", "ts"],
+}
+# 可能是后来加的列 / 当初 JSON 里没有的列
+OPTIONAL_FIELDS = {
+    "produce": ["retailer", "bottle_key"],
+    "ship":    ["is_milestone", "bottle_id"],
+    "deliver": [],
+}
+# 上链后会被改写的列：尝试当初写链时的取值
+REWRITTEN_FIELDS = {
+    "produce": {"current_status": ["Produced"]},
+}
+SEPARATORS = {"紧凑分隔符": (",", ":"), "默认分隔符": (", ", ": ")}
+ZERO_HASH = "00" * 32
+
+
+def row_key_of(stage: str, row: dict) -> bytes:
+    """rowKey 规则与 winery_produce / shipper_ship / retailer_deliver 完全一致"""
+    if stage == "produce":
+        return keccak(text=f"wine_batch:{row['id']}")
+    return keccak(text=f"{stage}:{row['bottle_id']}:{row['ts']}")
+
+
+def candidates(stage: str):
+    """枚举候选序列化：[(偏差说明列表, 规则 dict)]，偏差越少越靠前
+
+    偏差为空的那一个就是当前规则（与 customer_verify.py 相同）。
+    键序枚举全排列（每段至多 5! = 120 种），字母序只是其中之一。
+    """
+    fields = STAGE_FIELDS[stage]
+    drops = [c for n in range(len(OPTIONAL_FIELDS[stage]) + 1)
+             for c in itertools.combinations(OPTIONAL_FIELDS[stage], n)]
+    rewrites = [None] + [(k, v) for k, vs in REWRITTEN_FIELDS.get(stage, {}).items() for v in vs]
+    ts_types = ["str", "int"] if "ts" in fields else ["str"]
+
+    out = []
+    for drop, rewrite, ts_type, sep in itertools.product(drops, rewrites, ts_types, SEPARATORS):
+        kept = [f for f in fields if f not in drop]
+        for order in itertools.permutations(kept):   # 第一个排列即原顺序
+            diff = [f"缺少 {c}" for c in drop]
+            if rewrite:
+                diff.append(f"{rewrite[0]}={rewrite[1]}")
+            if ts_type == "int":
+                diff.append("ts 为 int")
+            if list(order) == sorted(kept):
+                diff.append("键按字母排序")
+            elif list(order) != kept:
+                diff.append("键序 " + ",".join(order))
+            if sep != "紧凑分隔符":
+                diff.append(sep)
+            rule = {"fields": list(order), "rewrite": rewrite, "ts_type": ts_type, "sep": SEPARATORS[sep]}
+            out.append((diff, rule))
+    out.sort(key=lambda c: len(c[0]))
+    return out
+
+
+def serialize(row: dict, rule: dict) -> str:
+    obj = {f: row.get(f) for f in rule["fields"]}
+    if rule["rewrite"]:
+        obj[rule["rewrite"][0]] = rule["rewrite"][1]
+    if rule["ts_type"] == "int" and str(obj.get("ts", "")).isdigit():
+        obj["ts"] = int(obj["ts"])
+    return json.dumps(obj, separators=rule["sep"])
+
+
+# ─── 2. 单行诊断（在子进程里跑）──────────────────────────────
+def classify(item):
+    """item = (row_key_hex, stage, [候选 DB 行], chain_hash) → (row_key_hex, 根因, 命中的 JSON)
+
+    chain_hash 为 None 表示 --proofs-json 里没有这个 row_key（不等于链上无记录）。
+    """
+    rk, stage, rows, chain = item
+    if not rows:
+        return rk, "DB 中找不到该 row_key 对应的行", None
+    if chain is None:
+        return rk, f"[{stage}] proofs 文件中没有该 row_key（未查链）", None
+    if chain == ZERO_HASH:
+        return rk, f"[{stage}] 链上无记录（storeHash 未成功）", None
+    for diff, rule in CANDIDATES[stage]:
+        for row in rows:
+            s = serialize(row, rule)
+            if hashlib.sha256(s.encode()).hexdigest() == chain:
+                return rk, f"[{stage}] " + ("一致" if not diff else "，".join(diff)), s
+    return rk, f"[{stage}] 无候选命中（行内容已被改写？）", None
+
+
+CANDIDATES = {stage: candidates(stage) for stage in STAGE_FIELDS}
+
+
+# ─── 3. DB 扫描：row_key → 行 ─────────────────────────────────
+def load_rows(db_path: str, stages):
+    conn = open_db(db_path)                      # 已归档季节的行也要能反查
+    conn.row_factory = sqlite3.Row
+    queries = {
+        "produce": "SELECT * FROM bottle;",
+        "ship":    "SELECT * FROM transport_event WHERE is_milestone=1;",
+        "deliver": "SELECT * FROM sold_event;",
+    }
+    index = {}                                   # row_key_hex → (stage, [rows])
+    for stage in stages:
+        for r in conn.execute(queries[stage]):
+            row = dict(r)
+            rk = "0x" + row_key_of(stage, row).hex()
+            index.setdefault(rk, (stage, []))[1].append(row)
+    conn.close()
+    return index
+
+
+def norm_hash(h) -> str:
+    h = h.hex() if isinstance(h, (bytes, bytearray)) else str(h)
+    return h.lower().removeprefix("0x")
+
+
+def main():
+    cli = argparse.ArgumentParser(description="批量诊断链上 / 本地哈希不一致并按根因分组")
+    cli.add_argument("--db",          default="wine_demo.db")
+    cli.add_argument("--row-keys",    help="待诊断 row_key 列表文件（每行一个 0x…）；缺省为全库")
+    cli.add_argument("--stage",       nargs="+", choices=list(STAGE_FIELDS), default=list(STAGE_FIELDS))
+    cli.add_argument("--proofs-json", help="离线链上 hash：{row_key: hash}，给出则不连 RPC")
+    cli.add_argument("--rpc-workers", type=int, default=16, help="并行 getProof 线程数")
+    cli.add_argument("--workers",     type=int, default=None, help="候选匹配进程数（默认 CPU 数）")
+    cli.add_argument("--out",         help="逐行诊断结果写入此 JSON 文件")
+    args = cli.parse_args()
+
+    index = load_rows(args.db, args.stage)
+    if args.row_keys:
+        with open(args.row_keys, encoding="utf-8") as f:
+            keys = [l.strip().lower() for l in f if l.strip()]
+        keys = [k if k.startswith("0x") else "0x" + k for k in keys]
+    else:
+        keys = list(index)
+    print(f"🔎 待诊断 {len(keys)} 个 row_key")
+
+    # ── 链上 hash ──
+    if args.proofs_json:
+        proofs = {k.lower(): norm_hash(v) for k, v in json.load(open(args.proofs_json)).items()}
+        chain = [proofs.get(k) for k in keys]
+    else:
+        load_dotenv("customer.env")               # 只需 RPC_URL
+        cfg = json.load(open("config.json"))
+        w3  = Web3(Web3.HTTPProvider(cfg["rpc_url"]))
+        audit = w3.eth.contract(address=cfg["audit_addr"],
+                                abi=json.load(open(cfg["audit_abi"])))
+        get = lambda k: norm_hash(audit.functions.getProof(bytes.fromhex(k[2:])).call()[0])
+        with ThreadPoolExecutor(args.rpc_workers) as pool:
+            chain = list(pool.map(get, keys))
+
+    # ── 候选匹配 ──
+    items = [(k, *index.get(k, ("?", [])), h) for k, h in zip(keys, chain)]
+    with ProcessPoolExecutor(args.workers) as pool:
+        results = list(pool.map(classify, items, chunksize=256))
+
+    # ── 按根因汇总 ──
+    groups = {}
+    for rk, cause, _ in results:
+        groups.setdefault(cause, []).append(rk)
+    table = [[cause, len(rks), rks[0]] for cause, rks in
+             sorted(groups.items(), key=lambda g: -len(g[1]))]
+    print("\n根因分组")
+    print(tabulate(table, headers=["根因", "行数", "示例 rowKey"], tablefmt="github"))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump([{"row_key": rk, "cause": cause, "matched_json": s} for rk, cause, s in results],
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n📄 逐行结果已写入 {args.out}")
+
+
+if __name__ == "__main__":
+    main()
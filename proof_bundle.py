@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# proof_bundle.py —— 每瓶离线证明包：规范行 + 哈希 + 链上引用，消费者验证无需 RPC
+# 用法示例：
+#   python proof_bundle.py build --all                          # 生成 / 刷新并签名 bundles/<bottle_id>.json
+#   python proof_bundle.py build --bottle-id coco1514 --key-env winery.env
+#   python proof_bundle.py verify --bottle-id coco1514          # 本地校验签名与内容（静态文件即可）
+#   python proof_bundle.py verify --bottle-id coco1514 --spot-check   # 另外抽查链上 getProof / 回执
+# 依赖：pip install web3 python-dotenv tabulate
+#
+# 证明包内容：
+#   stages[]  —— produce / ship / deliver 各段的规范 JSON（与 customer_verify.py 复算规则一致）、
+#                row_key、row_hash，以及 chain_tx 中该段的交易哈希、区块号 / 区块哈希、
+#                StageUpdated / HashStored 事件参数
+#   details   —— 供展示的 bottle / batch / 运输 / 售出行
+#   signature —— 运营方密钥对以上内容的 EIP-191 签名
+#
+# 证明包里的哈希与事件都来自同一个文件，只查自洽挡不住整体伪造；离线信任来自签名：
+# verify 要求签名者等于 config.json 的 "bundle_signer"（或 --signer）。
+# 签名证明的是“运营方出具了这份包”，链上锚定本身仍需 --spot-check 复核。
+# verify 有任何一项 × 时以非 0 退出码结束，静态页面 / 扫码脚本可据此判断。
+#
+# bundle_signer 的设置：填 build 所用 --key-env 里 PRIVATE_KEY 对应的地址
+# （默认是部署 audit_addr 的运营方钱包；build 结束时会打印签名者地址，与配置不符会提示）。
+# 换签名密钥后要同时改 config.json 并重新 build --all，旧包会因签名者不符而校验失败。
+import json, os, sqlite3, argparse, hashlib, pathlib, time
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from eth_utils import keccak
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+from dotenv import load_dotenv
+from tabulate import tabulate
+from archive_seasons import open_db
+from chain_log import decode_logs
+
+BUNDLE_DIR = "bundles"
+BUNDLE_VERSION = 1
+STAGE_CODE = {"produce": 1, "ship": 2, "deliver": 3}      # BottleLifecycle.bottles() 的 stage 编号
+
+
+def sha256_hex(obj: dict) -> tuple:
+    """规范紧凑 JSON 及其 sha256（0x 前缀）"""
+    s = json.dumps(obj, separators=(",", ":"))
+    return s, "0x" + hashlib.sha256(s.encode()).hexdigest()
+
+
+def row_key_hex(stage: str, obj: dict) -> str:
+    """rowKey 规则与三个写链脚本一致"""
+    if stage == "produce":
+        return "0x" + keccak(text=f"wine_batch:{obj['id']}").hex()
+    return "0x" + keccak(text=f"{stage}:{obj['bottle_id']}:{obj['ts']}").hex()
+
+
+# ─── 1. 生成 ──────────────────────────────────────────────────
+def build_bundle(conn, bid: str, cfg: dict):
+    """从 DB（含已归档季节）组装一只瓶子的证明包；瓶子不存在返回 None"""
+    one = lambda sql, *p: conn.execute(sql, p).fetchone()
+    bottle = one("SELECT * FROM bottle WHERE id=?;", bid)
+    if not bottle:
+        return None
+    batch = one("SELECT * FROM wine_batch WHERE id=?;", bottle["batch_id"])
+    ship  = one("SELECT * FROM transport_event WHERE bottle_id=? AND is_milestone=1 "
+                "ORDER BY ts DESC LIMIT 1;", bid)
+    sold  = one("SELECT * FROM sold_event WHERE bottle_id=? LIMIT 1;", bid)
+    events = conn.execute("SELECT * FROM transport_event WHERE bottle_id=? ORDER BY ts;", (bid,)).fetchall()
+
+    cores = [("produce", dict(bottle))]
+    if ship:
+        cores.append(("ship", {"location": ship["location"], "status": ship["status"], "ts": ship["ts"],
+                               "is_milestone": ship["is_milestone"], "bottle_id": bid}))
+    if sold:
+        cores.append(("deliver", {"bottle_id": sold["bottle_id"], "store": sold["store"], "ts": sold["ts"]}))
+
+    has_chain_tx = bool(conn.execute("PRAGMA table_info(chain_tx);").fetchall())
+    stages = []
+    for stage, core in cores:
+        canonical, row_hash = sha256_hex(core)
+        rk = row_key_hex(stage, core)
+        txs = []
+        if has_chain_tx:
+            # storeHash 按 row_key 精确匹配；lifecycle 取该段最近一笔
+            rows = conn.execute("""
+                SELECT * FROM chain_tx WHERE bottle_id=? AND stage=?
+                  AND (kind='lifecycle' OR row_key=?)
+                ORDER BY id DESC;
+            """, (bid, stage, rk)).fetchall()
+            for kind in ("lifecycle", "storeHash"):
+                r = next((r for r in rows if r["kind"] == kind), None)
+                if r:
+                    txs.append({"kind": kind, "tx_hash": r["tx_hash"], "block_number": r["block_number"],
+                                "block_hash": r["block_hash"], "status": r["status"],
+                                "logs": json.loads(r["logs_json"] or "[]")})
+        stages.append({"stage": stage, "row_key": rk, "canonical": canonical,
+                       "row_hash": row_hash, "txs": txs})
+
+    return {
+        "version":    BUNDLE_VERSION,
+        "bottle_id":  bid,
+        "bottle_key": "0x" + keccak(text="bottle:" + bid).hex(),
+        "chain_id":   cfg["chain_id"],
+        "audit_addr": cfg["audit_addr"],
+        "life_addr":  cfg["life_addr"],
+        "stages":     stages,
+        "details": {
+            "bottle":           dict(bottle),
+            "batch":            dict(batch) if batch else None,
+            "transport_events": [dict(r) for r in events],
+            "sold_event":       dict(sold) if sold else None,
+        },
+    }
+
+
+def signing_message(bundle: dict):
+    """签名覆盖除 signature / generated_at 外的全部字段（键排序的紧凑 JSON）"""
+    body = {k: v for k, v in bundle.items() if k not in ("signature", "generated_at")}
+    return encode_defunct(text=json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False))
+
+
+def write_bundle(bundle: dict, acct, bundle_dir: str = BUNDLE_DIR) -> bool:
+    """签名后写入；内容与签名者都未变则不重写（保留原 generated_at）；返回是否写入"""
+    path = pathlib.Path(bundle_dir) / f"{bundle['bottle_id']}.json"
+    if path.exists():
+        old = json.loads(path.read_text(encoding="utf-8"))
+        signer = (old.pop("signature", None) or {}).get("signer")
+        old.pop("generated_at", None)
+        if old == bundle and signer == acct.address:
+            return False
+    sig = acct.sign_message(signing_message(bundle)).signature
+    bundle = {**bundle, "signature": {"signer": acct.address, "sig": "0x" + bytes(sig).hex()}}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps({**bundle, "generated_at": int(time.time())}, ensure_ascii=False, indent=2),
+                   encoding="utf-8")
+    os.replace(tmp, path)
+    return True
+
+
+# ─── 2. 本地校验 ──────────────────────────────────────────────
+def verify_signature(bundle: dict, signer: str) -> list:
+    """签名者须等于预期的运营方地址；未配置预期地址时签名不提供任何信任，记为 –"""
+    sig = bundle.get("signature") or {}
+    if not sig.get("sig"):
+        return [["bundle", "运营方签名", "×"]]
+    if not signer:
+        return [["bundle", "运营方签名（未配置 bundle_signer）", "–"]]
+    try:
+        recovered = Account.recover_message(signing_message(bundle), signature=sig["sig"])
+    except Exception:
+        recovered = None
+    ok = recovered is not None and recovered.lower() == signer.lower()
+    return [["bundle", f"运营方签名 ({signer})", "✓" if ok else "×"]]
+
+
+def verify_bundle(bundle: dict, cfg: dict) -> list:
+    """只用证明包本身与本地配置做校验；返回 [[stage, 检查项, ✓/×/–]]"""
+    bid = bundle["bottle_id"]
+    bottle_key = "0x" + keccak(text="bottle:" + bid).hex()
+    results = [["bottle", "bottle_key", "✓" if bundle["bottle_key"] == bottle_key else "×"],
+               ["bundle", "合约地址 / chain_id 与 config.json 一致",
+                "✓" if (bundle["audit_addr"], bundle["life_addr"], bundle["chain_id"])
+                == (cfg["audit_addr"], cfg["life_addr"], cfg["chain_id"]) else "×"]]
+
+    for st in bundle["stages"]:
+        stage = st["stage"]
+        core = json.loads(st["canonical"])
+        owner = core.get("id") if stage == "produce" else core.get("bottle_id")
+        check = lambda name, ok: results.append([stage, name, "✓" if ok else "×"])
+
+        check("行属于该瓶", owner == bid)
+        check("row_hash = sha256(规范 JSON)",
+              "0x" + hashlib.sha256(st["canonical"].encode()).hexdigest() == st["row_hash"])
+        check("row_key = keccak(规则)", row_key_hex(stage, core) == st["row_key"])
+
+        txs = {t["kind"]: t for t in st["txs"]}
+        store = txs.get("storeHash")
+        if store:
+            logs = [l["args"] for l in store["logs"] if l["event"] == "HashStored"]
+            check("storeHash 交易成功", store["status"] == 1)
+            check("HashStored 事件 = row_key / row_hash",
+                  any(a["rowKey"] == st["row_key"] and a["hash"] == st["row_hash"] for a in logs))
+        else:
+            results.append([stage, "storeHash 链上引用", "–"])
+
+        life = txs.get("lifecycle")
+        if life:
+            logs = [l["args"] for l in life["logs"] if l["event"] == "StageUpdated"]
+            check(f"StageUpdated 事件 (stage={STAGE_CODE[stage]})",
+                  any(a["bottleKey"] == bottle_key and a["stage"] == STAGE_CODE[stage] for a in logs))
+        else:
+            results.append([stage, "lifecycle 链上引用", "–"])
+    return results
+
+
+def spot_check(bundle: dict, cfg: dict) -> list:
+    """可选：连 RPC 复核 getProof，以及每笔交易的回执（区块、目标合约、解码后的事件参数）"""
+    w3 = Web3(Web3.HTTPProvider(cfg["rpc_url"]))
+    # 合约一律取本地 config.json，不信证明包里写的地址
+    contracts = {
+        "storeHash": w3.eth.contract(address=cfg["audit_addr"], abi=json.load(open(cfg["audit_abi"]))),
+        "lifecycle": w3.eth.contract(address=cfg["life_addr"],  abi=json.load(open(cfg["life_abi"]))),
+    }
+    audit = contracts["storeHash"]
+    results = []
+    for st in bundle["stages"]:
+        chain_hex = "0x" + bytes(audit.functions.getProof(bytes.fromhex(st["row_key"][2:])).call()[0]).hex()
+        results.append([st["stage"], "链上 getProof = row_hash", "✓" if chain_hex == st["row_hash"] else "×"])
+        for tx in st["txs"]:
+            contract = contracts[tx["kind"]]
+            try:
+                rec = w3.eth.get_transaction_receipt(tx["tx_hash"])
+            except TransactionNotFound:                   # 被重组掉或根本不存在
+                results.append([st["stage"], f"{tx['kind']} 交易 {tx['tx_hash']} 链上不存在", "×"])
+                continue
+            ok_block = ("0x" + bytes(rec.blockHash).hex() == tx["block_hash"]
+                        and rec.blockNumber == tx["block_number"] and rec.status == 1)
+            ok_to = (rec.to or "").lower() == contract.address.lower()
+            ok_logs = decode_logs(contract, tx["kind"], rec) == tx["logs"]
+            results.append([st["stage"], f"{tx['kind']} 回执区块 / 状态", "✓" if ok_block else "×"])
+            results.append([st["stage"], f"{tx['kind']} 回执目标合约", "✓" if ok_to else "×"])
+            results.append([st["stage"], f"{tx['kind']} 回执事件 = 包内 logs", "✓" if ok_logs else "×"])
+    return results
+
+
+def main():
+    cli = argparse.ArgumentParser(description="每瓶离线证明包：生成 / 本地校验")
+    sub = cli.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--bottle-id", nargs="+")
+    b.add_argument("--all", action="store_true", help="为库中（含归档）全部瓶子生成")
+    b.add_argument("--key-env", default="winery.env", help="签名私钥所在 env 文件（PRIVATE_KEY）")
+    v = sub.add_parser("verify")
+    v.add_argument("--bottle-id", required=True)
+    v.add_argument("--signer", help="预期签名者地址，默认取 config.json 的 bundle_signer")
+    v.add_argument("--spot-check", action="store_true", help="额外连 RPC 抽查链上数据")
+    for p in (b, v):
+        p.add_argument("--db",         default="wine_demo.db")
+        p.add_argument("--bundle-dir", default=BUNDLE_DIR)
+    args = cli.parse_args()
+
+    load_dotenv("customer.env")
+    cfg = json.load(open("config.json"))
+
+    if args.cmd == "build":
+        load_dotenv(args.key_env)
+        acct = Account.from_key(os.environ["PRIVATE_KEY"])
+        conn = open_db(args.db)
+        conn.row_factory = sqlite3.Row
+        ids = args.bottle_id or []
+        if args.all:
+            ids = [r[0] for r in conn.execute("SELECT id FROM bottle ORDER BY id;")]
+        written = 0
+        for bid in ids:
+            bundle = build_bundle(conn, bid, cfg)
+            if bundle is None:
+                print(f"❌ 瓶子 {bid} 不存在")
+                continue
+            written += write_bundle(bundle, acct, args.bundle_dir)
+        conn.close()
+        print(f"✅ 证明包 {len(ids)} 个，其中 {written} 个有更新 → {args.bundle_dir}/（签名者 {acct.address}）")
+        if (cfg.get("bundle_signer") or "").lower() != acct.address.lower():
+            print(f"⚠  config.json 的 bundle_signer 为 {cfg.get('bundle_signer')}，与签名者不符，"
+                  "verify 会判失败；请把它改成上面的地址")
+        return
+
+    path = pathlib.Path(args.bundle_dir) / f"{args.bottle_id}.json"
+    if not path.exists():
+        raise SystemExit(f"No proof bundle for '{args.bottle_id}' ({path}).")
+    bundle = json.loads(path.read_text(encoding="utf-8"))
+    signer = args.signer or cfg.get("bundle_signer")
+    sig_result = verify_signature(bundle, signer)
+    results = sig_result + verify_bundle(bundle, cfg)
+    if args.spot_check:
+        results += spot_check(bundle, cfg)
+
+    print(tabulate(results, headers=["Stage", "Check", "✓/×"], tablefmt="github"))
+    if any(r[2] == "×" for r in results):
+        print("\n✗ Proof bundle failed verification.")
+        raise SystemExit(1)
+    elif sig_result[0][2] != "✓":
+        print("\n⚠ Bundle is only self-consistent: no expected signer is configured, so it proves nothing"
+              " about provenance – set bundle_signer in config.json or pass --signer / --spot-check.")
+    elif any(r[2] == "–" for r in results):
+        print(f"\n⚠ Bundle is signed by {signer}, but some stages have no recorded chain reference"
+              " (written before tx logging) – use --spot-check.")
+    elif args.spot_check:
+        print(f"\nBundle signed by {signer} and its chain references confirmed on-chain ✓")
+    else:
+        print(f"\nBundle signature and contents verified ✓ (offline, signed by {signer});"
+              " on-chain anchoring is attested by the signer – use --spot-check to confirm it.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# replicate_db.py —— 把写端 wine_demo.db（含 archive/ 季节库）增量同步到只读副本目录
+# 用法示例：
+#   python replicate_db.py --replica /mnt/verify1 --replica /mnt/verify2            # 同步一轮
+#   python replicate_db.py --replica /mnt/verify1 --interval 30 --metrics rep.prom  # 每 30 s 一轮，写指标
+#   python customer_verify.py --bottle-id coco1514 --replica-dir /mnt/verify1       # 读端走副本
+#
+# 每轮：
+#   1) 热库与 archive/ 各归档库挂在同一连接上，在一个读事务里用 SQLite backup API 拷出快照，
+#      保证 archive_seasons.py 搬季节时副本不会出现重复或缺失的瓶子；
+#      只重拷文件头版本变过的库，读事务（写端提交需等待）通常只覆盖拷热库的那一小段
+#   2) 副本端两代轮换：<副本>/gen-a、gen-b 各存一整套库，current 符号链接指向当前代；
+#      按页摘要比对快照与另一代，只把变化的页写进去、删掉源端已不存在的库，
+#      再原子地改 current —— 每轮过网络的只有变化的页，内容没变的轮次不动副本
+#   3) 副本目录写 replica_meta.json：快照时间（读端据此算延迟）、本轮传输页数 / 字节数
+#
+# 注意：非当前代两轮后会被原地改写，读端连接的存活时间须短于一个 --interval
+# （customer_verify.py 每次运行都新开连接，满足这一点）。
+import sqlite3, argparse, pathlib, hashlib, json, time, os
+from archive_seasons import archive_files, open_db
+
+SNAPSHOT_DIR = ".replica_snapshot"
+META_FILE    = "replica_meta.json"
+SNAPSHOT_STATE = "state.json"                   # 各库上次拍快照时的文件头版本
+CURRENT_LINK = "current"                         # 副本目录里指向当前代的符号链接
+DIGEST_SIZE  = 8                                 # 每页摘要字节数（blake2b）
+
+
+# ─── 1. 快照 ──────────────────────────────────────────────────
+def _signature(path: pathlib.Path) -> list:
+    """库文件的版本标识：文件头 change counter（回滚日志模式下每次提交 +1）、大小、mtime"""
+    st = path.stat()
+    with open(path, "rb") as f:
+        f.seek(24)
+        return [int.from_bytes(f.read(4), "big"), st.st_size, st.st_mtime_ns]
+
+
+def snapshot_all(db_path: str, archive_dir: str) -> list:
+    """热库 + 全部归档在同一读事务里拷出快照；返回 [(快照路径, 副本内相对路径, page_size)]
+
+    写端是回滚日志模式，读事务持有期间写端 COMMIT 要等待，所以只拷上一轮之后变过的库：
+    平时只有热库在变，锁只在拷热库那一下；归档库只在 archive_seasons.py 搬季节后重拷一次。
+    """
+    state_path = pathlib.Path(SNAPSHOT_DIR) / SNAPSHOT_STATE
+    state = json.loads(state_path.read_text()) if state_path.exists() else {}
+    while True:
+        files = archive_files(archive_dir)
+        src = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, isolation_level=None)
+        try:
+            schemas = [("main", pathlib.Path(db_path).name, pathlib.Path(db_path))]
+            for label, path in files.items():
+                src.execute(f"ATTACH DATABASE ? AS season_{label};", (f"file:{path}?mode=ro",))
+                schemas.append((f"season_{label}", f"archive/{path.name}", path))
+
+            # 每个库都读一次，让读事务在所有库上拿到共享锁（此后文件头不会再变）
+            src.execute("BEGIN;")
+            for schema, _, _ in schemas:
+                src.execute(f"SELECT COUNT(*) FROM {schema}.sqlite_master;").fetchone()
+            if archive_files(archive_dir).keys() != files.keys():
+                continue                         # 加锁前恰好新建了归档文件，重来一轮
+
+            out, new_state = [], {}
+            for schema, rel, path in schemas:
+                snap = pathlib.Path(SNAPSHOT_DIR) / rel
+                sig = _signature(path)
+                if state.get(rel) != sig or not snap.exists():
+                    snap.parent.mkdir(parents=True, exist_ok=True)
+                    snap.unlink(missing_ok=True)
+                    dst = sqlite3.connect(snap)
+                    try:
+                        src.backup(dst, name=schema)
+                    finally:
+                        dst.close()
+                page_size = src.execute(f"PRAGMA {schema}.page_size;").fetchone()[0]
+                out.append((snap, rel, page_size))
+                new_state[rel] = sig
+            src.execute("COMMIT;")
+        finally:
+            src.close()
+
+        # 源端已消失的库，快照也删掉
+        for rel in set(state) - set(new_state):
+            (pathlib.Path(SNAPSHOT_DIR) / rel).unlink(missing_ok=True)
+        tmp = state_path.with_name(SNAPSHOT_STATE + ".tmp")
+        tmp.write_text(json.dumps(new_state))
+        os.replace(tmp, state_path)
+        return out
+
+
+def page_digests(path: pathlib.Path, page_size: int) -> list:
+    """每页的摘要；第 0 页摘要不含文件头里每次 backup 都会变的字段
+
+    change counter（24–27）与 version-valid-for / SQLITE_VERSION_NUMBER（92–99）只要写一次就会变，
+    不屏蔽的话内容没变的库也会每轮重传第 0 页、翻转一次文件。
+    """
+    out = []
+    with open(path, "rb") as f:
+        while page := f.read(page_size):
+            if not out:
+                page = page[:24] + bytes(4) + page[28:92] + bytes(8) + page[100:]
+            out.append(hashlib.blake2b(page, digest_size=DIGEST_SIZE).digest())
+    return out
+
+
+# ─── 2. 按页增量传输（两代轮换）────────────────────────────────
+def _read_manifest(path: pathlib.Path) -> list:
+    if not path.exists():
+        return []
+    raw = path.read_bytes()
+    return [raw[i:i + DIGEST_SIZE] for i in range(0, len(raw), DIGEST_SIZE)]
+
+
+def _write_manifest(path: pathlib.Path, digests: list):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(b"".join(digests))
+    os.replace(tmp, path)
+
+
+def ship(snap: pathlib.Path, target: pathlib.Path, page_size: int, new: list) -> tuple:
+    """快照 → 副本某一代里的同名文件，只写摘要不同的页；返回 (传输页数, 传输字节数)
+
+    <name>.pages 记录该文件当前内容的页摘要；摘要缺失（首次 / 上次写到一半）时全量写入。
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    manifest = target.with_name(target.name + ".pages")
+    old = _read_manifest(manifest) if target.exists() else []
+    if old == new:
+        return 0, 0
+    manifest.unlink(missing_ok=True)             # 改写中途崩溃 → 下一轮按全量处理
+    if not old:
+        target.write_bytes(b"")
+    changed = [i for i, d in enumerate(new) if i >= len(old) or old[i] != d]
+    with open(snap, "rb") as s, open(target, "r+b") as t:
+        for i in changed:
+            s.seek(i * page_size)
+            t.seek(i * page_size)
+            t.write(s.read(page_size))
+        t.truncate(len(new) * page_size)
+        t.flush()
+        os.fsync(t.fileno())
+    _write_manifest(manifest, new)
+    return len(changed), len(changed) * page_size
+
+
+def _generation(rdir: pathlib.Path) -> dict:
+    """某一代目录里现有的库文件：{相对路径: 页摘要}"""
+    return {p.relative_to(rdir).as_posix(): _read_manifest(p.with_name(p.name + ".pages"))
+            for p in rdir.rglob("*.db")} if rdir.is_dir() else {}
+
+
+def publish(snaps: list, rdir: pathlib.Path) -> tuple:
+    """一轮快照发布为副本的新一代；返回 (传输页数, 传输字节数, 总页数)
+
+    副本目录下 gen-a / gen-b 两代轮换，current 符号链接指向读端该打开的那一代。
+    新一代写进另一个目录（只写变化的页、删掉源端已没有的库），再原子地改 current，
+    读端一次 resolve 就拿到同一代的热库与全部归档，不会看到半新半旧的组合。
+    """
+    link = rdir / CURRENT_LINK
+    cur_name = os.readlink(link) if link.is_symlink() else None
+    digests = {rel: page_digests(snap, page_size) for snap, rel, page_size in snaps}
+    total = sum(len(d) for d in digests.values())
+    if cur_name and _generation(rdir / cur_name) == digests:
+        return 0, 0, total                       # 与当前代完全相同：不动副本
+
+    spare = rdir / ("gen-b" if cur_name == "gen-a" else "gen-a")
+    pages = nbytes = 0
+    for snap, rel, page_size in snaps:
+        p, b = ship(snap, spare / rel, page_size, digests[rel])
+        pages, nbytes = pages + p, nbytes + b
+    for rel in set(_generation(spare)) - set(digests):   # 源端已删除 / 改名的库
+        (spare / rel).unlink()
+        (spare / (rel + ".pages")).unlink(missing_ok=True)
+
+    tmp = rdir / (CURRENT_LINK + ".tmp")
+    tmp.unlink(missing_ok=True)
+    os.symlink(spare.name, tmp)
+    os.replace(tmp, link)
+    return pages, nbytes, total
+
+
+def replicate_once(db_path: str, archive_dir: str, replicas: list) -> dict:
+    """同步一轮；返回 {副本目录: 指标 dict}"""
+    snap_ts = time.time()
+    snaps = snapshot_all(db_path, archive_dir)
+
+    stats = {}
+    for rdir in replicas:
+        rdir = pathlib.Path(rdir)
+        rdir.mkdir(parents=True, exist_ok=True)
+        meta_path = rdir / META_FILE
+        prev = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+        t0 = time.time()
+        pages, nbytes, total = publish(snaps, rdir)
+        meta = {
+            "source":              str(pathlib.Path(db_path).resolve()),
+            "snapshot_ts":         snap_ts,
+            "generation":          os.readlink(rdir / CURRENT_LINK),
+            "pages_total":         total,
+            "pages_shipped":       pages,
+            "bytes_shipped":       nbytes,
+            "transfer_s":          round(time.time() - t0, 3),
+            "rounds":              prev.get("rounds", 0) + 1,
+            "bytes_shipped_total": prev.get("bytes_shipped_total", 0) + nbytes,
+        }
+        tmp = meta_path.with_name(META_FILE + ".tmp")
+        tmp.write_text(json.dumps(meta, indent=2))
+        os.replace(tmp, meta_path)
+        stats[str(rdir)] = meta
+    return stats
+
+
+# ─── 3. 读端 ──────────────────────────────────────────────────
+def replica_lag(replica_dir: str) -> float:
+    """副本相对写端的延迟（秒）= 现在 − 副本所含快照的时间"""
+    meta = json.loads((pathlib.Path(replica_dir) / META_FILE).read_text())
+    return time.time() - meta["snapshot_ts"]
+
+
+def open_replica(replica_dir: str, db_name: str = "wine_demo.db") -> sqlite3.Connection:
+    """只读打开副本（含副本里的季节归档），查询方式与 archive_seasons.open_db 相同"""
+    gen = (pathlib.Path(replica_dir) / CURRENT_LINK).resolve(strict=True)   # 只 resolve 一次，整个连接都用这一代
+    return open_db(f"file:{gen / db_name}?mode=ro", str(gen / "archive"))
+
+
+def write_prometheus(path: str, stats: dict):
+    """node_exporter textfile 格式"""
+    lines = []
+    for name, help_ in (("replica_lag_seconds", "Seconds since the snapshot held by the replica"),
+                        ("replica_bytes_shipped", "Bytes shipped in the last round"),
+                        ("replica_pages_shipped", "Pages shipped in the last round"),
+                        ("replica_bytes_shipped_total", "Bytes shipped since the replica was created")):
+        lines += [f"# HELP {name} {help_}", f"# TYPE {name} gauge"]
+        for rdir, m in stats.items():
+            val = {"replica_lag_seconds":         time.time() - m["snapshot_ts"],
+                   "replica_bytes_shipped":       m["bytes_shipped"],
+                   "replica_pages_shipped":       m["pages_shipped"],
+                   "replica_bytes_shipped_total": m["bytes_shipped_total"]}[name]
+            lines.append(f'{name}{{replica="{rdir}"}} {val:.3f}')
+    tmp = pathlib.Path(path + ".tmp")
+    tmp.write_text("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+def main():
+    cli = argparse.ArgumentParser(description="wine_demo.db 只读副本增量同步")
+    cli.add_argument("--db",          default="wine_demo.db")
+    cli.add_argument("--archive-dir", default="archive")
+    cli.add_argument("--replica",     action="append", required=True, help="副本目录，可重复")
+    cli.add_argument("--interval",    type=float, default=0, help="同步间隔秒；0 = 只同步一轮")
+    cli.add_argument("--metrics",     help="Prometheus textfile 输出路径")
+    args = cli.parse_args()
+
+    while True:
+        stats = replicate_once(args.db, args.archive_dir, args.replica)
+        for rdir, m in stats.items():
+            print(f"🔁 {rdir}: {m['pages_shipped']}/{m['pages_total']} 页，"
+                  f"{m['bytes_shipped']} B，{m['transfer_s']} s")
+        if args.metrics:
+            write_prometheus(args.metrics, stats)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ from eth_account import Account
 from eth_utils  import keccak
 from web3       import Web3
 from dotenv     import load_dotenv
+from chain_log  import SCHEMA as CHAIN_TX_SCHEMA, record_tx
 
 # ───────── 1·CLI ─────────
 cli = argparse.ArgumentParser()
@@ -38,14 +39,15 @@ def send(tx):
                "gas":300_000})
     signed = acct.sign_transaction(tx)
     txh = w3.eth.send_raw_transaction(signed.raw_transaction)
-    w3.eth.wait_for_transaction_receipt(txh)
+    rec = w3.eth.wait_for_transaction_receipt(txh)
     print("⛓  tx =", txh.hex())
     nonce += 1
-    return txh.hex()
+    return rec
 
 # ───────── 3·DB 事务 ─────────
 conn = sqlite3.connect("wine_demo.db", isolation_level=None)
 cur  = conn.cursor()
+conn.executescript(CHAIN_TX_SCHEMA)
 
 try:
     cur.execute("BEGIN;")
@@ -76,8 +78,10 @@ try:
         print("row_hash     :", "0x"+row_hash.hex())
 
         # --- 两笔链上交易 ---
-        tx1 = send(life.functions.ship(bottle_key).build_transaction())
-        tx2 = send(audit.functions.storeHash(row_key, row_hash).build_transaction())
+        rec1 = send(life.functions.ship(bottle_key).build_transaction())
+        rec2 = send(audit.functions.storeHash(row_key, row_hash).build_transaction())
+        record_tx(cur, args.bottle_id, "ship", "lifecycle", rec1, life)
+        record_tx(cur, args.bottle_id, "ship", "storeHash", rec2, audit, row_key)
 
         # --- 链上校验 ---
         chain_hash = audit.functions.getProof(row_key).call()[0].hex()
@@ -6,6 +6,7 @@ from eth_account import Account
 from eth_utils import keccak
 from web3 import Web3
 from dotenv import load_dotenv
+from chain_log import SCHEMA as CHAIN_TX_SCHEMA, record_tx
 
 # ─── 1·解析 CLI ────────────────────────────────────────────────
 cli = argparse.ArgumentParser()
@@ -29,7 +30,7 @@ life  = w3.eth.contract(address=cfg["life_addr"],  abi=json.load(open(cfg["life_
 audit = w3.eth.contract(address=cfg["audit_addr"], abi=json.load(open(cfg["audit_abi"])))
 
 def send(tx):
-    """签名并发送交易，返回交易哈希 hex 字符串"""
+    """签名并发送交易，返回交易回执"""
     global nonce
     tx.update({"from":acct.address,"nonce":nonce,
                "chainId":cfg["chain_id"],"gas":300_000
@@ -40,11 +41,12 @@ def send(tx):
     if rec.status != 1:
         raise RuntimeError(f"Tx reverted: {txh.hex()}")
     nonce += 1
-    return txh.hex()
+    return rec
 
 # ─── 3·本地 DB 事务 ───────────────────────────────────────────
 conn = sqlite3.connect("wine_demo.db", isolation_level=None)
 cur  = conn.cursor()
+conn.executescript(CHAIN_TX_SCHEMA)
 
 try:
     cur.execute("BEGIN;")
@@ -83,12 +85,16 @@ try:
     print("row_hash     :", "0x"+row_hash.hex())
 
     # ④ 链上双交易
-    tx1 = send(life.functions.produce(bottle_key).build_transaction())
-    print("⛓  produce tx =", tx1)
-    tx2 = send(audit.functions.storeHash(row_key, row_hash).build_transaction())
-    print("⛓  storeHash tx =", tx2)
+    rec1 = send(life.functions.produce(bottle_key).build_transaction())
+    print("⛓  produce tx =", rec1.transactionHash.hex())
+    rec2 = send(audit.functions.storeHash(row_key, row_hash).build_transaction())
+    print("⛓  storeHash tx =", rec2.transactionHash.hex())
 
-    # ⑤ 查询链上 hash 以确认
+    # ⑤ 交易哈希 / 回执 / 事件落库（proof_bundle.py 用）
+    record_tx(cur, bid, "produce", "lifecycle", rec1, life)
+    record_tx(cur, bid, "produce", "storeHash", rec2, audit, row_key)
+
+    # ⑥ 查询链上 hash 以确认
     chain_hash = audit.functions.getProof(row_key).call()[0].hex()
     print("\n链上实际 hash  :", chain_hash)
     print("本地 row_hash  :", "0x"+row_hash.hex())